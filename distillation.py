@@ -5,9 +5,44 @@ This module implements the Iterative DEJMPS (Dür, Ekert, Jozsa, Macchiavello, P
 entanglement distillation protocol for purifying noisy Bell pairs.
 """
 
+from functools import lru_cache
+import io
+import operator
+from math import pi as _PI
+import types
+from typing import Dict, Iterable, Tuple
+
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
-from qiskit import qasm3
-import numpy as np
+from qiskit.circuit.classical import expr
+
+# Twirling rotation angles (Alice: +π/2, Bob: -π/2)
+_PI_2 = _PI / 2
+_NEG_PI_2 = -_PI_2
+
+# Classical bits: every step measures its ancilla pair into the two scratch
+# bits and immediately folds their parity into the flag, so 3 bits cover any N
+_ALICE_MEAS = 0
+_BOB_MEAS = 1
+FLAG_BIT = 2
+
+# OpenQASM 3.0 templates for `_build_qasm`, filled with %-formatting
+_QASM_HEADER = (
+    "OPENQASM 3.0;\n"
+    'include "stdgates.inc";\n'
+    "bit[3] c;\n"
+    "qubit[%d] q;\n"
+)
+_QASM_STEP = (
+    "rx(pi/2) q[%(alice_target)d];\n"
+    "rx(pi/2) q[%(alice_ancilla)d];\n"
+    "rx(-pi/2) q[%(bob_target)d];\n"
+    "rx(-pi/2) q[%(bob_ancilla)d];\n"
+    "cx q[%(alice_ancilla)d], q[%(alice_target)d];\n"
+    "cx q[%(bob_ancilla)d], q[%(bob_target)d];\n"
+    "c[%(alice_meas)d] = measure q[%(alice_ancilla)d];\n"
+    "c[%(bob_meas)d] = measure q[%(bob_ancilla)d];\n"
+    "c[%(flag_bit)d] = c[%(flag_bit)d] | c[%(alice_meas)d] ^ c[%(bob_meas)d];\n"
+)
 
 
 def create_distillation_circuit(num_bell_pairs: int) -> QuantumCircuit:
@@ -21,6 +56,11 @@ def create_distillation_circuit(num_bell_pairs: int) -> QuantumCircuit:
     3. Measures ancilla qubits and checks if measurements match (parity check)
     4. Sets a flag bit to 1 if any step fails (measurements don't match)
     
+    Classical Bit Mapping:
+    - Total classical bits: 3 (independent of N)
+    - c[0], c[1]: Alice's and Bob's ancilla measurement, reused by every step
+    - c[2]: flag bit (`FLAG_BIT`), 0 = all parity checks passed
+    
     Qubit Mapping:
     - Total qubits: 2N
     - Alice's register: qubits 0 to N-1
@@ -36,11 +76,12 @@ def create_distillation_circuit(num_bell_pairs: int) -> QuantumCircuit:
         QuantumCircuit: Qiskit circuit implementing the distillation protocol.
                        The circuit includes a `_modified_qasm3` attribute containing
                        the OpenQASM 3.0 string with flag logic, and a `get_qasm3_with_flag()`
-                       method to retrieve it. Use `qc._modified_qasm3` or `qc.get_qasm3_with_flag()`
-                       when submitting to the server instead of `qasm3.dumps(qc)`.
+                       method to retrieve it. The flag logic is part of the circuit itself,
+                       so this string equals `qasm3.dumps(qc)` and the circuit can also be
+                       passed to `GameClient.claim_edge` with `flag_bit=FLAG_BIT`.
         
     Raises:
-        ValueError: If num_bell_pairs is not between 2 and 8
+        ValueError: If num_bell_pairs is not an integer between 2 and 8
         
     Example:
         >>> qc = create_distillation_circuit(2)
@@ -49,104 +90,201 @@ def create_distillation_circuit(num_bell_pairs: int) -> QuantumCircuit:
         >>> # Or access directly:
         >>> qasm_str = qc._modified_qasm3
     """
-    # Validate input
-    if not (2 <= num_bell_pairs <= 8):
-        raise ValueError("num_bell_pairs must be between 2 and 8")
+    # The circuit and its QASM only depend on N (7 possible values): the QASM
+    # is precomputed at import, the circuit is built once per N on first use
+    # and each call hands out a fresh copy of it
+    N = _validate_num_bell_pairs(num_bell_pairs)
+    new_qasm_str = _QASM_BY_N[N]
+    qc = _circuit_template(N).copy()
+    
+    # Store the OpenQASM 3.0 string with flag logic as an attribute; it is
+    # identical to `qasm3.dumps(qc)` but needs no serialization at submit time
+    qc._modified_qasm3 = new_qasm_str
+    
+    # Bind the helper method to get the OpenQASM 3.0 string with flag logic
+    qc.get_qasm3_with_flag = types.MethodType(_get_qasm3_with_flag, qc)
+    
+    return qc
+
+
+def create_distillation_circuits(num_bell_pairs: Iterable[int]) -> Dict[int, QuantumCircuit]:
+    """
+    Creates distillation circuits for several values of N at once.
     
-    N = num_bell_pairs
+    Duplicate values are built once, and each distinct N reuses the per-N
+    circuit cache shared with `create_distillation_circuit`.
     
+    Args:
+        num_bell_pairs: Numbers of Bell pairs N (each 2 <= N <= 8)
+        
+    Returns:
+        Dict[int, QuantumCircuit]: Circuit per distinct N, as returned by
+                                   `create_distillation_circuit`
+        
+    Raises:
+        ValueError: If any num_bell_pairs value is not an integer between 2 and 8
+    """
+    # Validate and normalize all values before building any circuit
+    ns = list(dict.fromkeys(_validate_num_bell_pairs(n) for n in num_bell_pairs))
+    
+    return {n: create_distillation_circuit(n) for n in ns}
+
+
+def create_distillation_qasm(num_bell_pairs: int) -> str:
+    """
+    Returns the OpenQASM 3.0 string (with flag logic) of the Iterative DEJMPS
+    distillation circuit, without constructing any Qiskit objects.
+    
+    This is the same string as `create_distillation_circuit(N).get_qasm3_with_flag()`;
+    use it directly when only the QASM text is needed for submission.
+    
+    Args:
+        num_bell_pairs: Number of Bell pairs N (2 <= N <= 8)
+        
+    Returns:
+        str: OpenQASM 3.0 program with the flag in classical bit `FLAG_BIT` (c[2])
+        
+    Raises:
+        ValueError: If num_bell_pairs is not an integer between 2 and 8
+        
+    Example:
+        >>> qasm_str = create_distillation_qasm(2)
+    """
+    return _QASM_BY_N[_validate_num_bell_pairs(num_bell_pairs)]
+
+
+def _validate_num_bell_pairs(num_bell_pairs: int) -> int:
+    """
+    Validates N and normalizes it to a plain int.
+    
+    Integer types such as NumPy integers are accepted via `operator.index`;
+    bools and non-integers (e.g. 3.0) are rejected so they cannot alias a cached N.
+    """
+    try:
+        if isinstance(num_bell_pairs, bool):
+            raise TypeError
+        N = operator.index(num_bell_pairs)
+    except TypeError:
+        raise ValueError("num_bell_pairs must be an integer between 2 and 8") from None
+    if N not in _QASM_BY_N:
+        raise ValueError("num_bell_pairs must be an integer between 2 and 8")
+    return N
+
+
+def _get_qasm3_with_flag(self: QuantumCircuit) -> str:
+    """Get the OpenQASM 3.0 string with flag logic included."""
+    return self._modified_qasm3
+
+
+@lru_cache(maxsize=8)
+def _step_indices(N: int) -> Tuple[Tuple[int, int], ...]:
+    """
+    Returns (alice_ancilla, bob_ancilla) for each distillation step
+    k = 0..N-2, shared by the circuit and QASM builders.
+    """
+    # Alice's ancillas run k = 0..N-2, Bob's mirror them as 2N-1-k (outside-in pairing)
+    return tuple(zip(range(N - 1), range(2*N - 1, N, -1)))
+
+
+def _circuit_template(N: int) -> QuantumCircuit:
+    """
+    Returns the cached distillation circuit for N, building it on first use.
+    
+    Callers must not mutate the returned circuit.
+    """
+    qc = _CIRCUIT_BY_N.get(N)
+    if qc is None:
+        qc = _CIRCUIT_BY_N[N] = _build_circuit(N)
+    return qc
+
+
+def _build_circuit(N: int) -> QuantumCircuit:
+    """
+    Builds the distillation circuit for N Bell pairs, including the flag logic.
+    """
     # Create registers
     # Total qubits: 2N (Alice: 0..N-1, Bob: N..2N-1)
     qr = QuantumRegister(2*N, 'q')
-    # Classical register: 2*(N-1) for measurements + 1 flag bit = 2N-1 total
-    cr = ClassicalRegister(2*N-1, 'c')
+    # Classical register: 2 scratch measurement bits + 1 flag bit
+    cr = ClassicalRegister(3, 'c')
     qc = QuantumCircuit(qr, cr)
     
-    # Target pair indices (innermost pair - the output)
-    alice_target = N - 1
-    bob_target = N
+    # Bind gate methods and plain bit lists once; list indexing avoids going
+    # through the registers' __getitem__ on every access in the loop
+    rx, cx, measure, store = qc.rx, qc.cx, qc.measure, qc.store
+    qubits = list(qr)
+    alice_meas = cr[_ALICE_MEAS]
+    bob_meas = cr[_BOB_MEAS]
+    flag = cr[FLAG_BIT]
     
-    # Flag bit index (last classical bit)
-    flag_bit = 2*N - 2
+    # Flag Logic: flag |= (alice_meas ^ bob_meas), the same expression for every step
+    flag_update = expr.bit_or(flag, expr.bit_xor(alice_meas, bob_meas))
     
-    # Iterate through each ancilla pair k (from 0 to N-2)
-    for k in range(N - 1):
-        # Ancilla pair indices
-        alice_ancilla = k
-        bob_ancilla = 2*N - 1 - k
-        
-        # Classical bit indices for measurements
-        alice_meas = 2*k
-        bob_meas = 2*k + 1
+    # Target pair qubits (innermost pair - the output)
+    alice_target = qubits[N - 1]
+    bob_target = qubits[N]
+    
+    # Iterate through each ancilla pair k (from 0 to N-2) with its ancilla qubit indices
+    for alice_ancilla, bob_ancilla in _step_indices(N):
+        # Each gate call below is broadcast by Qiskit over a list of qubits,
+        # applying the same gate to every pair in order. Gates are only batched
+        # within a step: the target pair is reused by every step, so the
+        # rotations of step k+1 must not be hoisted past the CNOTs of step k.
         
         # Step 1: Twirling (Local Rotations)
         # Alice applies R_x(π/2) to target and ancilla
-        qc.rx(np.pi/2, qr[alice_target])
-        qc.rx(np.pi/2, qr[alice_ancilla])
-        
+        rx(_PI_2, [alice_target, qubits[alice_ancilla]])
         # Bob applies R_x(-π/2) to target and ancilla
-        qc.rx(-np.pi/2, qr[bob_target])
-        qc.rx(-np.pi/2, qr[bob_ancilla])
+        rx(_NEG_PI_2, [bob_target, qubits[bob_ancilla]])
         
         # Step 2: CNOT Gates (LOCC operations)
-        # Alice: CNOT(control=ancilla, target=target)
-        qc.cx(qr[alice_ancilla], qr[alice_target])
-        # Bob: CNOT(control=ancilla, target=target)
-        qc.cx(qr[bob_ancilla], qr[bob_target])
+        # Alice and Bob: CNOT(control=ancilla, target=target)
+        cx([qubits[alice_ancilla], qubits[bob_ancilla]], [alice_target, bob_target])
         
         # Step 3: Measurement & Parity Check
-        # Measure Alice's ancilla qubit
-        qc.measure(qr[alice_ancilla], cr[alice_meas])
-        # Measure Bob's ancilla qubit
-        qc.measure(qr[bob_ancilla], cr[bob_meas])
-    
-    # Step 4: Flag Logic - Add classical operations using OpenQASM 3.0 string manipulation
-    # Convert circuit to OpenQASM 3.0 string
-    qasm_str = qasm3.dumps(qc)
-    
-    # Add flag logic: for each step, check if measurements don't match
-    # Flag should be 1 if ANY step fails (measurements don't match)
-    flag_logic_lines = []
-    flag_logic_lines.append("    // Flag logic: set flag = 1 if any measurements don't match")
-    
-    # For each distillation step, check if measurements match
-    for k in range(N - 1):
-        alice_meas = 2*k
-        bob_meas = 2*k + 1
-        flag_logic_lines.append(f"    // Step {k}: Check if c[{alice_meas}] != c[{bob_meas}]")
-        # Check both mismatch cases using OpenQASM 3.0 conditionals
-        flag_logic_lines.append(f"    if (c[{alice_meas}] == true && c[{bob_meas}] == false) {{")
-        flag_logic_lines.append(f"        c[{flag_bit}] = true;")
-        flag_logic_lines.append(f"    }}")
-        flag_logic_lines.append(f"    if (c[{alice_meas}] == false && c[{bob_meas}] == true) {{")
-        flag_logic_lines.append(f"        c[{flag_bit}] = true;")
-        flag_logic_lines.append(f"    }}")
-    
-    # Insert flag logic before the final closing brace
-    qasm_lines = qasm_str.split('\n')
-    
-    # Find the last closing brace (end of circuit body)
-    insert_pos = len(qasm_lines)
-    for i in range(len(qasm_lines) - 1, -1, -1):
-        stripped = qasm_lines[i].strip()
-        if stripped == '}' and i > 0:  # Found a closing brace (but not the very last one)
-            insert_pos = i
-            break
-    
-    # Insert flag logic
-    new_qasm_lines = qasm_lines[:insert_pos] + flag_logic_lines + qasm_lines[insert_pos:]
-    new_qasm_str = '\n'.join(new_qasm_lines)
-    
-    # Store the modified OpenQASM 3.0 string as an attribute
-    # Since Qiskit doesn't easily support parsing OpenQASM 3.0 with classical operations
-    # back into QuantumCircuit, we store the modified string for use when submitting
-    qc._modified_qasm3 = new_qasm_str
+        # Measure Alice's and Bob's ancilla qubits into the scratch bits and
+        # fold their mismatch into the flag before the next step overwrites them
+        measure([qubits[alice_ancilla], qubits[bob_ancilla]], [alice_meas, bob_meas])
+        store(flag, flag_update)
     
-    # Create a helper method to get the OpenQASM 3.0 string with flag logic
-    def get_qasm3_with_flag():
-        """Get the OpenQASM 3.0 string with flag logic included."""
-        return new_qasm_str
+    return qc
+
+
+def _build_qasm(N: int) -> str:
+    """
+    Emits the OpenQASM 3.0 string of the distillation circuit for N Bell pairs,
+    including the flag logic.
     
-    qc.get_qasm3_with_flag = get_qasm3_with_flag
+    The text is generated directly rather than via `qasm3.dumps` on the Qiskit
+    circuit, matching the exporter's output for `_build_circuit` byte-for-byte.
+    """
+    # Target pair indices (innermost pair - the output) and the classical bits
+    # are the same for every step; only the ancilla indices change
+    fields = {
+        "alice_target": N - 1,
+        "bob_target": N,
+        "alice_meas": _ALICE_MEAS,
+        "bob_meas": _BOB_MEAS,
+        "flag_bit": FLAG_BIT,
+    }
     
-    return qc
+    buf = io.StringIO()
+    write = buf.write
+    write(_QASM_HEADER % (2*N))
+    # Flag Logic: flag should be 1 if ANY step fails (measurements don't match).
+    # Each step folds its mismatch into the flag branchlessly, flag |= (a ^ b),
+    # right after measuring, before the next step overwrites the scratch bits;
+    # the flag bit starts out as 0
+    for alice_ancilla, bob_ancilla in _step_indices(N):
+        fields["alice_ancilla"] = alice_ancilla
+        fields["bob_ancilla"] = bob_ancilla
+        write(_QASM_STEP % fields)
+    
+    return buf.getvalue()
+
+
+# Every supported N (2..8) has a fixed QASM string, so all of them are generated once at import
+_QASM_BY_N = {n: _build_qasm(n) for n in range(2, 9)}
+
+# Circuit templates per N, filled on demand by `_circuit_template`
+_CIRCUIT_BY_N: Dict[int, QuantumCircuit] = {}
@@ -7,6 +7,12 @@ from client import GameClient
 import json
 from pathlib import Path
 
+# orjson parses noticeably faster when installed; the stdlib json is the fallback
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 # Set player_id
 PLAYER_ID = "doraking"
 PLAYER_NAME = "doraking"
@@ -15,17 +21,35 @@ PLAYER_NAME = "doraking"
 SESSION_FILE = Path("session.json")
 client = None
 
-if SESSION_FILE.exists():
+
+def load_session() -> dict:
+    """Read and decode session.json with a single read ({} if there is no session file)."""
     try:
-        with open(SESSION_FILE) as f:
-            data = json.load(f)
-        if data.get("player_id") == PLAYER_ID:
-            client = GameClient(api_token=data.get("api_token"))
-            client.player_id = data.get("player_id")
-            client.name = data.get("name")
-            print(f"Loaded session for {client.player_id}")
-    except Exception as e:
-        print(f"Error loading session: {e}")
+        return _json_loads(SESSION_FILE.read_bytes())
+    except FileNotFoundError:
+        return {}
+
+
+def save_session(data: dict) -> bool:
+    """Write session.json unless the file currently on disk already holds `data`. Returns True if written."""
+    try:
+        if load_session() == data:
+            return False
+    except ValueError:
+        pass  # Unreadable session file, overwrite it
+    SESSION_FILE.write_text(json.dumps(data))
+    return True
+
+
+try:
+    data = load_session()
+    if data.get("player_id") == PLAYER_ID:
+        client = GameClient(api_token=data.get("api_token"))
+        client.player_id = data.get("player_id")
+        client.name = data.get("name")
+        print(f"Loaded session for {client.player_id}")
+except Exception as e:
+    print(f"Error loading session: {e}")
 
 # Register if not loaded
 if not client or not client.api_token:
@@ -41,9 +65,8 @@ if not client or not client.api_token:
         
         # Save session
         if client.api_token:
-            with open(SESSION_FILE, "w") as f:
-                json.dump({"api_token": client.api_token, "player_id": client.player_id, "name": client.name}, f)
-            print(f"Session saved.")
+            if save_session({"api_token": client.api_token, "player_id": client.player_id, "name": client.name}):
+                print(f"Session saved.")
     else:
         print(f"Registration failed: {result.get('error', {}).get('message')}")
         if result.get("error", {}).get("code") == "PLAYER_EXISTS":